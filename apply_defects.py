@@ -1,16 +1,31 @@
 #!/usr/bin/env python3
 
 import json
+import os
+import re
 import shutil
 import argparse
+from collections import Counter
 from pathlib import Path
-from pymatgen.core import Element, Structure
-from pymatgen.io.vasp import Poscar, Incar, Potcar
+from pymatgen.core import Structure
+from pymatgen.io.vasp import Incar, Potcar
 from phonopy import Phonopy
 from phonopy.structure.atoms import PhonopyAtoms
 import warnings
 import numpy as np
 
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+try:
+    from scipy.spatial import Voronoi
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
 # === Suppress SHA256 warnings ===
 original_warn = warnings.warn
 def custom_warn(*args, **kwargs):
@@ -48,11 +63,12 @@ except Exception as e:
 
 # === Helpers ===
 canonical_order = ["La", "Y", "Mo", "Pb", "W", "O"]
+canonical_rank = {sym: i for i, sym in enumerate(canonical_order)}
 
 def structure_to_phonopy(structure):
-    return PhonopyAtoms(symbols=[site.specie.symbol for site in structure],
+    return PhonopyAtoms(symbols=[sp.symbol for sp in structure.species],
                         cell=structure.lattice.matrix,
-                        scaled_positions=[site.frac_coords for site in structure])
+                        scaled_positions=structure.frac_coords)
 
 def phonopy_to_structure(phonopy_atoms):
     from pymatgen.core import Lattice
@@ -65,69 +81,152 @@ def build_supercell_with_phonopy(structure, supercell_matrix):
     sc = phonon.get_supercell()
     return phonopy_to_structure(sc)
 
+def min_image_dists(trial, coords, lattice_matrix):
+    """Minimum-image distances between two sets of fractional coords."""
+    df = trial[:, None, :] - coords[None, :, :]
+    df -= np.rint(df)
+    dc = df @ lattice_matrix
+    return np.sqrt(np.einsum('ijk,ijk->ij', dc, dc))
+
+if HAS_NUMBA:
+    @njit(parallel=True, cache=True)
+    def _min_image_min_dist_jit(trial, coords, L):
+        out = np.empty(trial.shape[0])
+        for t in prange(trial.shape[0]):
+            best = np.inf
+            for a in range(coords.shape[0]):
+                dx = trial[t, 0] - coords[a, 0]
+                dy = trial[t, 1] - coords[a, 1]
+                dz = trial[t, 2] - coords[a, 2]
+                dx -= round(dx)
+                dy -= round(dy)
+                dz -= round(dz)
+                cx = dx * L[0, 0] + dy * L[1, 0] + dz * L[2, 0]
+                cy = dx * L[0, 1] + dy * L[1, 1] + dz * L[2, 1]
+                cz = dx * L[0, 2] + dy * L[1, 2] + dz * L[2, 2]
+                d2 = cx * cx + cy * cy + cz * cz
+                if d2 < best:
+                    best = d2
+            out[t] = np.sqrt(best)
+        return out
+
+def min_image_min_dist(trial, coords, lattice_matrix):
+    """Distance from each trial point to its nearest atom (minimum image)."""
+    if HAS_NUMBA:
+        return _min_image_min_dist_jit(np.ascontiguousarray(trial),
+                                       np.ascontiguousarray(coords),
+                                       np.ascontiguousarray(lattice_matrix))
+    return min_image_dists(trial, coords, lattice_matrix).min(axis=1)
+
+def _voronoi_empty_sites(coords, lattice_matrix, min_distance):
+    """Candidate insertion sites at Voronoi vertices, best clearance first."""
+    # Tile the 27 periodic images so vertices near the cell boundary are valid.
+    ax = np.array([-1.0, 0.0, 1.0])
+    shifts = np.stack(np.broadcast_arrays(ax[:, None, None], ax[None, :, None],
+                                          ax[None, None, :]), -1).reshape(-1, 3)
+    images = (coords[None, :, :] + shifts[:, None, :]).reshape(-1, 3)
+    vor = Voronoi(images @ lattice_matrix)
+
+    verts = vor.vertices @ np.linalg.inv(lattice_matrix)
+    verts = verts[np.all((verts >= 0) & (verts < 1), axis=1)]
+    if verts.size == 0:
+        return []
+
+    dists = min_image_min_dist(verts, coords, lattice_matrix)
+    order = np.argsort(-dists)
+    return [v for v, d in zip(verts[order], dists[order]) if d > min_distance]
+
 def find_empty_sites(structure, min_distance=1.5):
     """Find fractional coords not too close to existing atoms."""
-    coords = np.array([s.frac_coords for s in structure])
-    candidates = []
+    return _empty_sites(structure.frac_coords, structure.lattice.matrix, min_distance)
+
+def _empty_sites(coords, lattice_matrix, min_distance=1.5):
+    if HAS_SCIPY:
+        try:
+            return _voronoi_empty_sites(coords, lattice_matrix, min_distance)
+        except Exception:
+            pass  # degenerate geometry: fall back to the grid scan
+    return _grid_empty_sites(coords, lattice_matrix, min_distance)
+
+def _grid_empty_sites(coords, lattice_matrix, min_distance):
+    # No occupancy pre-prune here: at 10^3 resolution a grid point can sit
+    # up to sqrt(3) bin diagonals (~2 Å on typical cells) from an atom in
+    # its own bin, so any bin-level skip can discard points that pass the
+    # min_distance test. The vectorized kernel handles all 1000 points
+    # cheaply anyway.
     grid_size = 10
-    for x in np.linspace(0, 1, grid_size, endpoint=False):
-        for y in np.linspace(0, 1, grid_size, endpoint=False):
-            for z in np.linspace(0, 1, grid_size, endpoint=False):
-                trial = np.array([x, y, z])
-                dists = structure.lattice.get_all_distances(trial, coords)
-                if np.all(dists > min_distance):
-                    candidates.append(trial)
-    return candidates
+    ax = np.arange(grid_size) / grid_size
+    trial = np.stack(np.broadcast_arrays(ax[:, None, None], ax[None, :, None],
+                                         ax[None, None, :]), -1).reshape(-1, 3)
+    mask = min_image_min_dist(trial, coords, lattice_matrix) > min_distance
+    return list(trial[mask])
 
 def apply_defect(structure: Structure, delta: dict) -> Structure:
-    mod_structure = structure.copy()
+    symbols = [sp.symbol for sp in structure.species]
+    fracs = np.asarray(structure.frac_coords)
+    lattice_matrix = structure.lattice.matrix
     removed_coords = []
 
     for elem, change in delta.items():
         if change < 0:
-            indices = [i for i, site in enumerate(mod_structure) if site.specie.symbol == elem]
-            if len(indices) < abs(change):
+            mask_elem = np.fromiter((sym == elem for sym in symbols),
+                                    dtype=bool, count=len(symbols))
+            indices = np.flatnonzero(mask_elem)
+            if indices.size < abs(change):
                 raise ValueError(f"Not enough {elem} atoms to remove")
-            for i in sorted(indices[:abs(change)], reverse=True):
-                removed_coords.append(mod_structure[i].frac_coords)
-                mod_structure.remove_sites([i])
+            drop = indices[:abs(change)]
+            removed_coords.extend(fracs[i] for i in drop[::-1])
+            keep = np.ones(len(symbols), dtype=bool)
+            keep[drop] = False
+            symbols = [sym for sym, k in zip(symbols, keep) if k]
+            fracs = fracs[keep]
 
     for elem, change in delta.items():
         if change > 0:
-            added = 0
-
             # Use coordinates of removed atoms first
-            for coord in removed_coords:
-                mod_structure.append(species=Element(elem), coords=coord, coords_are_cartesian=False)
-                added += 1
-                if added == change:
-                    break
+            new_coords = removed_coords[:change]
+            if new_coords:
+                symbols.extend([elem] * len(new_coords))
+                fracs = np.vstack([fracs, new_coords])
+            added = len(new_coords)
 
             # Then find empty space
             if added < change:
-                empty_sites = find_empty_sites(mod_structure)
-                for coord in empty_sites:
-                    mod_structure.append(species=Element(elem), coords=coord, coords_are_cartesian=False)
-                    added += 1
-                    if added == change:
-                        break
+                empty_sites = _empty_sites(fracs, lattice_matrix)[:change - added]
+                if empty_sites:
+                    symbols.extend([elem] * len(empty_sites))
+                    fracs = np.vstack([fracs, empty_sites])
+                    added += len(empty_sites)
 
             if added < change:
                 raise ValueError(f"Could only add {added} of {change} requested {elem} atoms (not enough free space)")
 
-    return mod_structure
+    return Structure(structure.lattice, symbols, fracs)
 
-def get_valence_electrons(structure, potcar_path):
-    potcar = Potcar.from_file(potcar_path)
-    zval = {p.element: p.zval for p in potcar}
-    total = 0
-    for site in structure:
-        sym = site.specie.symbol
+_zval_cache = {}
+
+def get_valence_electrons(structure, template_name, potcar_path):
+    if template_name not in _zval_cache:
+        potcar = Potcar.from_file(potcar_path)
+        _zval_cache[template_name] = {p.element: p.zval for p in potcar}
+    zval = _zval_cache[template_name]
+    counts = Counter(sp.symbol for sp in structure.species)
+    total = 0.0
+    for sym, n in counts.items():
         if sym not in zval:
             raise ValueError(f"Element {sym} not in POTCAR")
-        total += zval[sym]
+        total += zval[sym] * n
     return total
 
+def link_or_copy(src, dst):
+    """Hardlink a read-only input into the folder, falling back to a copy."""
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
 def get_template_folder(delta):
     elements_added = [k for k, v in delta.items() if v > 0]
     if "La" in elements_added:
@@ -140,6 +239,9 @@ def get_template_folder(delta):
         return "Pb_W_O"
 
 # === Main loop ===
+job_name_re = re.compile(r'(?m)^[ \t]*#SBATCH --job-name=.*$')
+structure_base = build_supercell_with_phonopy(unitcell_structure, supercell_size)
+
 for name, spec in defect_data.items():
     if name.startswith("z"):
         print(f"⏭️  Skipping {name}")
@@ -149,11 +251,11 @@ for name, spec in defect_data.items():
         folder = base_dir / name
         folder.mkdir(exist_ok=True)
 
-        structure = build_supercell_with_phonopy(unitcell_structure, supercell_size)
+        structure = structure_base.copy()
         structure = apply_defect(structure, spec.get("delta", {}))
-        structure = structure.get_sorted_structure(key=lambda s: canonical_order.index(s.specie.symbol) if s.specie.symbol in canonical_order else 999)
+        structure = structure.get_sorted_structure(key=lambda s: canonical_rank.get(s.specie.symbol, 999))
 
-        Poscar(structure).write_file(folder / "POSCAR")
+        structure.to(filename=str(folder / "POSCAR"), fmt="poscar")
 
         template_name = get_template_folder(spec["delta"])
         template = input_root / template_name
@@ -163,22 +265,17 @@ for name, spec in defect_data.items():
         if not (input_root / "KPOINTS").exists():
             raise FileNotFoundError("Missing shared KPOINTS in z_input")
 
-        shutil.copy(template / "INCAR", folder / "INCAR")
-        shutil.copy(template / "POTCAR", folder / "POTCAR")
-        shutil.copy(input_root / "KPOINTS", folder / "KPOINTS")
+        link_or_copy(template / "POTCAR", folder / "POTCAR")
+        link_or_copy(input_root / "KPOINTS", folder / "KPOINTS")
 
-        incar = Incar.from_file(folder / "INCAR")
-        nelect = round(get_valence_electrons(structure, folder / "POTCAR")) - spec.get("charge", 0)
+        incar = Incar.from_file(template / "INCAR")
+        nelect = round(get_valence_electrons(structure, template_name, folder / "POTCAR")) - spec.get("charge", 0)
         incar["NELECT"] = nelect
         incar.write_file(folder / "INCAR")
 
-        job_lines = (input_root / "job.justhpc").read_text().splitlines()
-        with open(folder / "job.justhpc", "w") as f:
-            for line in job_lines:
-                if line.strip().startswith("#SBATCH --job-name="):
-                    f.write(f"#SBATCH --job-name={name}\n")
-                else:
-                    f.write(line + "\n")
+        job_text = (input_root / "job.justhpc").read_text()
+        job_text = job_name_re.sub(f"#SBATCH --job-name={name}", job_text)
+        (folder / "job.justhpc").write_text(job_text)
 
         print(f"✅ {name}: done (NELECT = {nelect})")
 
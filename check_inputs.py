@@ -3,9 +3,11 @@
 check_inputs.py — Summarize VASP input folders with NELECT, ΔQ, atom count, composition, job status, and missing files.
 """
 
+import mmap
 import os
 import sys
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from pymatgen.io.vasp.inputs import Incar, Poscar, Potcar
 
@@ -18,14 +20,18 @@ def detect_job_status(folder):
     if not outcar.exists():
         return "not started"
     try:
-        with open(outcar, "r", errors="ignore") as f:
-            content = f.read()
-            if "Voluntary context switches" in content:
-                return "finished"
-            elif "General timing and accounting" in content:
-                return "failed"
-            else:
+        with open(outcar, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
                 return "running"
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                tail_start = max(0, size - 131072)  # sentinels appear near EOF
+                if mm.rfind(b"Voluntary context switches", tail_start) != -1:
+                    return "finished"
+                elif mm.rfind(b"General timing and accounting", tail_start) != -1:
+                    return "failed"
+                else:
+                    return "running"
     except:
         return "unreadable"
 
@@ -112,12 +118,9 @@ def check_folder(folder):
 def main():
     base = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(".")
     folders = [f for f in base.iterdir() if f.is_dir()]
-    results = []
 
-    for folder in sorted(folders):
-        info = check_folder(folder)
-        if info:
-            results.append(info)
+    with ProcessPoolExecutor() as executor:
+        results = [info for info in executor.map(check_folder, sorted(folders)) if info]
 
     print("\nSummary of VASP input folders:\n")
     print("{:<25} {:<14} {:<6} {:<30} {:<15} {}".format(
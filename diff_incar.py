@@ -27,18 +27,16 @@ ref_incar = Incar.from_file(ref_incar_path)
 all_keys = set()
 diffs = {}
 
-for folder in folders:
-    incar = Incar.from_file(folder / "INCAR")
-    diff = {}
-    for key in set(ref_incar.keys()).union(set(incar.keys())):
-        if key in ignore_keys:
-            continue
-        val_ref = ref_incar.get(key, None)
-        val_cur = incar.get(key, None)
-        if val_ref != val_cur:
-            diff[key] = val_cur
-            all_keys.add(key)
-    diffs[folder.name] = diff
+incars = {folder.name: Incar.from_file(folder / "INCAR") for folder in folders}
+ref_keys = set(ref_incar) - ignore_keys
+
+for name, incar in incars.items():
+    diff = {key: val for key, val in incar.items()
+            if key not in ignore_keys and ref_incar.get(key) != val}
+    for key in ref_keys - set(incar):
+        diff[key] = None
+    all_keys.update(diff)
+    diffs[name] = diff
 
 # === Format and print table chunks ===
 all_keys = sorted(all_keys)
@@ -9,6 +9,8 @@ Options:
 """
 
 import sys
+from ast import literal_eval
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from pymatgen.io.vasp.inputs import Incar
 
@@ -26,8 +28,8 @@ def parse_args():
                 parser.error(f"Invalid --set argument: {pair}")
             key, val = pair.split('=', 1)
             try:
-                val = eval(val)  # Convert to int/float/bool if possible
-            except:
+                val = literal_eval(val)  # Convert to int/float/bool if possible
+            except (ValueError, SyntaxError):
                 pass
             set_dict[key.upper()] = val
     return set_dict, args.dry_run
@@ -48,10 +50,12 @@ def edit_incar_in_folder(folder, set_dict, dry_run):
     changes = []
     for key, value in set_dict.items():
         old_val = incar.get(key, None)
+        if old_val == value:
+            continue
         incar[key] = value
         changes.append(f"{key}={old_val} → {value}")
 
-    if not dry_run:
+    if changes and not dry_run:
         incar.write_file(incar_path)
 
     change_str = ", ".join(changes) if changes else "✓ no change"
@@ -61,12 +65,11 @@ def main():
     set_dict, dry_run = parse_args()
 
     base = Path(".")
-    folders = [f for f in base.iterdir() if f.is_dir()]
-    results = []
+    folders = sorted(f for f in base.iterdir() if f.is_dir())
 
-    for folder in sorted(folders):
-        result = edit_incar_in_folder(folder, set_dict, dry_run)
-        results.append(result)
+    with ThreadPoolExecutor(max_workers=min(32, max(1, len(folders)))) as executor:
+        results = list(executor.map(
+            lambda folder: edit_incar_in_folder(folder, set_dict, dry_run), folders))
 
     print("\nEditing INCAR files:\n")
     for line in results: